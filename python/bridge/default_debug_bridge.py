@@ -19,11 +19,75 @@
 import ctypes
 import os
 import os.path
+import struct
 import json_tools as js
 from elftools.elf.elffile import ELFFile
 import time
 
 
+_unpack_32 = struct.Struct('<I').unpack_from
+_unpack_16 = struct.Struct('<H').unpack_from
+_unpack_8 = struct.Struct('<B').unpack_from
+
+_pack_32 = struct.Struct('<I').pack
+_pack_16 = struct.Struct('<H').pack
+_pack_8 = struct.Struct('<B').pack
+
+_PT_LOAD = 1
+
+
+def _elf_load_segments(file):
+    """Return the entry point and the PT_LOAD program headers of an ELF file.
+
+    Only the ELF and program headers are decoded, as a list of
+    (p_offset, p_paddr, p_filesz, p_memsz) tuples.
+    """
+    file.seek(0)
+    header = file.read(64)
+    if len(header) < 52 or header[0:4] != b'\x7fELF':
+        raise Exception('Invalid ELF file')
+
+    is_64 = header[4] == 2
+    endian = '>' if header[5] == 2 else '<'
+
+    if is_64:
+        if len(header) < 64:
+            raise Exception('Invalid ELF file')
+        entry, phoff = struct.unpack_from(endian + 'QQ', header, 24)
+        phentsize, phnum = struct.unpack_from(endian + 'HH', header, 54)
+        phdr = struct.Struct(endian + 'IIQQQQQQ')
+    else:
+        entry, phoff = struct.unpack_from(endian + 'II', header, 24)
+        phentsize, phnum = struct.unpack_from(endian + 'HH', header, 42)
+        phdr = struct.Struct(endian + 'IIIIIIII')
+
+    file.seek(phoff)
+    table = file.read(phentsize * phnum)
+    if len(table) < phentsize * phnum:
+        raise Exception('Invalid ELF file')
+
+    segments = []
+    for index in range(phnum):
+        fields = phdr.unpack_from(table, index * phentsize)
+        if fields[0] != _PT_LOAD:
+            continue
+        if is_64:
+            offset, paddr, filesz, memsz = fields[2], fields[4], fields[5], fields[6]
+        else:
+            offset, paddr, filesz, memsz = fields[1], fields[3], fields[4], fields[5]
+        segments.append((offset, paddr, filesz, memsz))
+
+    return entry, segments
+
+
+# ELF segments are sent to the target in tiles of this size, so that
+# large segments are never materialized as a whole
+_LOAD_TILE_SIZE = 1 << 16
+
+# Shared zero buffer used to clear BSS areas, written tile by tile
+_ZERO_CHUNK = bytes(_LOAD_TILE_SIZE)
+
+
 class Ctype_cable(object):
 
     def __init__(self, module, config, system_config):
@@ -64,7 +128,7 @@ class Ctype_cable(object):
         self.module.cable_jtag_set_reg.restype = ctypes.c_bool
 
         self.module.cable_jtag_get_reg.argtypes = \
-            [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+            [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
         self.module.cable_jtag_get_reg.restype = ctypes.c_bool
 
         self.module.cable_lock.argtypes = \
@@ -78,7 +142,7 @@ class Ctype_cable(object):
             
         self.module.bridge_init.argtypes = [ctypes.c_char_p, ctypes.c_int]
 
-        self.module.gdb_server_open.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self.module.gdb_server_open.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_char_p]
         self.module.gdb_server_open.restype = ctypes.c_void_p
 
         self.module.gdb_server_close.argtypes = [ctypes.c_void_p, ctypes.c_int]
@@ -97,32 +161,31 @@ class Ctype_cable(object):
         return self.instance
 
     def write(self, addr, size, buffer):
-        data = (ctypes.c_char * size).from_buffer(bytearray(buffer))
-        self.module.cable_write(self.instance, addr, size, data)
+        # bytes can be handed to the C side as is, and writable buffers
+        # (bytearray, memoryview on them) are wrapped without any copy.
+        # Anything else is converted once.
+        if not isinstance(buffer, bytes):
+            try:
+                buffer = (ctypes.c_char * size).from_buffer(buffer)
+            except TypeError:
+                buffer = bytes(buffer)
+        if isinstance(buffer, bytes) and len(buffer) < size:
+            raise ValueError('Buffer size too small (size: %d, buffer size: %d)' % (size, len(buffer)))
+        self.module.cable_write(self.instance, addr, size, buffer)
 
     def reg_write(self, addr, size, buffer, device=-1):
         data = (ctypes.c_char * size).from_buffer(bytearray(buffer))
         self.module.cable_reg_write(self.instance, addr, data, device)
 
     def read(self, addr, size):
-        data = (ctypes.c_char * size)()
+        data = ctypes.create_string_buffer(size)
         self.module.cable_read(self.instance, addr, size, data)
-
-        result = []
-        for elem in data:
-            result.append(elem)
-
-        return result
+        return ctypes.string_at(data, size)
 
     def reg_read(self, addr, size, device=-1):
-        data = (ctypes.c_char * size)()
+        data = ctypes.create_string_buffer(size)
         self.module.cable_reg_read(self.instance, addr, data, device)
-
-        result = []
-        for elem in data:
-            result.append(elem)
-
-        return result
+        return ctypes.string_at(data, size)
 
     def chip_reset(self, value, duration=1000000):
         self.module.chip_reset(self.instance, value, duration)
@@ -166,6 +229,7 @@ class debug_bridge(object):
         self.verbose = verbose
         self.gdb_handle = None
         self.cable_config = config.get('**/debug_bridge/cable')
+        self._symbol_cache = {}
 
 
 
@@ -223,6 +287,13 @@ class debug_bridge(object):
             system_config = self.config
         )
 
+        # Once the cable is there, memory accesses can go straight to it
+        # unless a chip bridge has its own implementation
+        if type(self).read is debug_bridge.read:
+            self.read = self.cable.read
+        if type(self).write is debug_bridge.write:
+            self.write = self.cable.write
+
     def get_cable(self):
         if self.cable is None:
             self.__mount_cable()
@@ -239,49 +310,67 @@ class debug_bridge(object):
         if self.verbose:
             print ('Loading %s' % binary)
 
+        # Segments are read tile by tile into this buffer, which is writable
+        # and can thus be handed to the cable without any copy
+        tile = bytearray(_LOAD_TILE_SIZE)
+        view = memoryview(tile)
+
         with open(binary, 'rb') as file:
-            elffile = ELFFile(file)
+            entry, segments = _elf_load_segments(file)
 
-            for segment in elffile.iter_segments():
+            for offset, addr, filesz, memsz in segments:
 
-                if segment['p_type'] == 'PT_LOAD':
+                if self.verbose:
+                    print ('Loading section (base: 0x%x, size: 0x%x)' % (addr, filesz))
 
-                    data = segment.data()
-                    addr = segment['p_paddr']
-                    size = len(data)
+                file.seek(offset)
 
+                if filesz < memsz and memsz <= _LOAD_TILE_SIZE:
+                    # Small enough to send the data and the zeroed part in a
+                    # single cable access
+                    self.__read_tile(file, view[:filesz])
+                    view[filesz:memsz] = _ZERO_CHUNK[:memsz - filesz]
+                    if self.verbose:
+                        print ('Init section to 0 (base: 0x%x, size: 0x%x)' % (addr + filesz, memsz - filesz))
+                    self.write(addr, memsz, view[:memsz])
+                    continue
+
+                for tile_offset in range(0, filesz, _LOAD_TILE_SIZE):
+                    iter_size = min(_LOAD_TILE_SIZE, filesz - tile_offset)
+                    data = view[:iter_size]
+                    self.__read_tile(file, data)
+                    self.write(addr + tile_offset, iter_size, data)
+
+                if filesz < memsz:
+                    addr += filesz
+                    size = memsz - filesz
                     if self.verbose:
-                        print ('Loading section (base: 0x%x, size: 0x%x)' % (addr, size))
-
-                    self.write(addr, size, data)
-
-                    if segment['p_filesz'] < segment['p_memsz']:
-                        addr = segment['p_paddr'] + segment['p_filesz']
-                        size = segment['p_memsz'] - segment['p_filesz']
                         print ('Init section to 0 (base: 0x%x, size: 0x%x)' % (addr, size))
-                        self.write(
-                            addr,
-                            size,
-                            [0] * size
-                        )
-
+                    while size > 0:
+                        iter_size = min(size, _LOAD_TILE_SIZE)
+                        self.write(addr, iter_size, _ZERO_CHUNK)
+                        addr += iter_size
+                        size -= iter_size
 
-            set_pc_addr_config = self.config.get('**/debug_bridge/set_pc_addr')
+        set_pc_addr_config = self.config.get('**/debug_bridge/set_pc_addr')
 
-            if set_pc_addr_config is not None:
-                set_pc_offset_config = self.config.get('**/debug_bridge/set_pc_offset')
-                entry = elffile.header['e_entry']
+        if set_pc_addr_config is not None:
+            set_pc_offset_config = self.config.get('**/debug_bridge/set_pc_offset')
 
-                if set_pc_offset_config is not None:
-                    entry += set_pc_offset_config.get_int()
+            if set_pc_offset_config is not None:
+                entry += set_pc_offset_config.get_int()
 
-                if self.verbose:
-                    print ('Setting PC (base: 0x%x, value: 0x%x)' % (set_pc_addr_config.get_int(), entry))
+            if self.verbose:
+                print ('Setting PC (base: 0x%x, value: 0x%x)' % (set_pc_addr_config.get_int(), entry))
 
-                return self.write_32(set_pc_addr_config.get_int(), entry)
+            return self.write_32(set_pc_addr_config.get_int(), entry)
 
         return 0
 
+    def __read_tile(self, file, data):
+        if file.readinto(data) != len(data):
+            raise Exception('Truncated ELF segment')
+
     def load(self, binaries=None):
         if binaries is None:
             binaries = self.binaries
@@ -332,55 +421,56 @@ class debug_bridge(object):
         return self.get_cable().reg_write(addr, size, value.to_bytes(size, byteorder='little'), device)
 
     def write_32(self, addr, value):
-        return self.write_int(addr, value, 4)
+        return self.write(addr, 4, _pack_32(value))
 
     def write_16(self, addr, value):
-        return self.write_int(addr, value, 2)
+        return self.write(addr, 2, _pack_16(value))
 
     def write_8(self, addr, value):
-        return self.write_int(addr, value, 1)
+        return self.write(addr, 1, _pack_8(value))
 
     def read_int(self, addr, size):
-        byte_array = None
-        for byte in self.read(addr, size):
-            if byte_array == None:
-                byte_array = byte
-            else:
-                byte_array += byte
-        return int.from_bytes(byte_array, byteorder='little')
+        return int.from_bytes(self.read(addr, size), byteorder='little')
 
     def read_reg_int(self, addr, size, device=-1):
-        byte_array = None
-        for byte in self.get_cable().reg_read(addr, size, device):
-            if byte_array == None:
-                byte_array = byte
-            else:
-                byte_array += byte
-        return int.from_bytes(byte_array, byteorder='little')
+        return int.from_bytes(self.get_cable().reg_read(addr, size, device), byteorder='little')
 
     def read_32(self, addr):
-        return self.read_int(addr, 4)
+        return _unpack_32(self.read(addr, 4))[0]
 
     def read_16(self, addr):
-        return self.read_int(addr, 2)
+        return _unpack_16(self.read(addr, 2))[0]
 
     def read_8(self, addr):
-        return self.read_int(addr, 1)
+        return _unpack_8(self.read(addr, 1))[0]
+
+    def _get_binary_symbols(self, binary):
+        # Symbol tables are parsed once per binary and kept until the file
+        # is modified
+        mtime = os.path.getmtime(binary)
+        cached = self._symbol_cache.get(binary)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        symbols = {}
+        with open(binary, 'rb') as file:
+            elf = ELFFile(file)
+            for section in elf.iter_sections():
+                if section.header['sh_type'] == 'SHT_SYMTAB':
+                    for symbol in section.iter_symbols():
+                        symbols.setdefault(symbol.name, symbol.entry['st_value'])
+
+        self._symbol_cache[binary] = (mtime, symbols)
+        return symbols
 
     def _get_binary_symbol_addr(self, name, binaries=[]):
 
         binaries = binaries + self.binaries
 
         for binary in binaries:
-            with open(binary, 'rb') as file:
-                elf = ELFFile(file)
-                for section in elf.iter_sections():
-                    if section.header['sh_type'] == 'SHT_SYMTAB':
-                        for symbol in section.iter_symbols():
-                            if symbol.name == name:
-                                t_section=symbol.entry['st_shndx']
-                                t_vaddr=symbol.entry['st_value']
-                                return t_vaddr
+            addr = self._get_binary_symbols(binary).get(name)
+            if addr is not None:
+                return addr
         return 0
 
     def reset(self):
@@ -439,9 +529,11 @@ class debug_bridge(object):
 
         self.__flasher_init(flasher_init)
 
-        print ('efuse access')
+        if self.verbose:
+            print ('efuse access')
         self.module.bridge_reqloop_efuse_access(self.reqloop_handle, is_write, index, value, mask)
-        print ('efuse access done')
+        if self.verbose:
+            print ('efuse access done')
 
         self.__flasher_deinit()
 
@@ -503,9 +595,7 @@ class debug_bridge(object):
                         iter_size = size
                     if self.module.bridge_reqloop_flash_access(self.reqloop_handle, type, itf, cs, False, flash_addr, addr, iter_size):
                             return -1
-                    buff = self.read(addr, iter_size)
-                    for elem in buff:
-                        file.write(elem)
+                    file.write(self.read(addr, iter_size))
                     size -= iter_size
                     flash_addr += iter_size
 
@@ -555,7 +645,12 @@ class debug_bridge(object):
         raise Exception('Flash is not supported on this target')
 
     def gdb(self, port):
-        self.gdb_handle = self.module.gdb_server_open(self.get_cable().get_instance(), port)
+        # Let the server answer qXfer:exec-file:read by itself
+        exec_file = None
+        if len(self.binaries) != 0:
+            exec_file = os.path.abspath(self.binaries[0]).encode('utf-8')
+
+        self.gdb_handle = self.module.gdb_server_open(self.get_cable().get_instance(), port, exec_file)
         return 0
 
     def wait(self):
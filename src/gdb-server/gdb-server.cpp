@@ -23,9 +23,12 @@
 #include <stdarg.h>
 
 
-Gdb_server::Gdb_server(Log *log, Cable *cable, js::config *config, int socket_port)
+Gdb_server::Gdb_server(Log *log, Cable *cable, js::config *config, int socket_port, const char *exec_file)
 : log(log), cable(cable), config(config)
 {
+  // Must be set before the RSP threads are started as they read it
+  if (exec_file != NULL) this->exec_file = exec_file;
+
   target = new Target(this);
 
   bkp = new Breakpoints(this);
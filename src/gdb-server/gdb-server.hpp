@@ -33,6 +33,7 @@
 #include <string.h>
 #include <sys/select.h>
 #include <thread>
+#include <string>
 
 #include "cable.hpp"
 #include "json.hpp"
@@ -59,10 +60,12 @@ static int first_free_thread_id = 0;
 class Gdb_server
 {
 public:
-  Gdb_server(Log *log, Cable *cable, js::config *config, int socket_port);
+  Gdb_server(Log *log, Cable *cable, js::config *config, int socket_port, const char *exec_file=NULL);
   int stop(bool kill);
   void print(const char *format, ...);
 
+  std::string exec_file;
+
   Rsp *rsp;
   Log *log;
   Cable *cable;
@@ -148,8 +148,41 @@ bool Rsp::query(int socket_client, char* data, size_t len)
 
   if (strncmp ("qSupported", data, strlen ("qSupported")) == 0)
   {
+    if (!top->exec_file.empty())
+      return this->send_str(socket_client,  "PacketSize=256;qXfer:exec-file:read+");
     return this->send_str(socket_client,  "PacketSize=256");
   }
+  else if (strncmp ("qXfer:exec-file:read:", data, strlen ("qXfer:exec-file:read:")) == 0)
+  {
+    // The executable path is static, answer directly with the slice which
+    // is asked, 'l' marking the last one
+    unsigned int offset, length;
+    const char *annex_end = strchr(data + strlen ("qXfer:exec-file:read:"), ':');
+    if (annex_end == NULL || sscanf(annex_end + 1, "%x,%x", &offset, &length) != 2) {
+      top->log->print(LOG_ERROR, "Could not parse qXfer:exec-file:read packet\n");
+      return this->send_str(socket_client,  "E01");
+    }
+
+    if (top->exec_file.empty())
+      return this->send_str(socket_client,  "E00");
+
+    size_t file_len = top->exec_file.size();
+    if (offset >= file_len)
+      return this->send_str(socket_client,  "l");
+
+    if (length > sizeof(reply) - 1)
+      length = sizeof(reply) - 1;
+
+    size_t chunk = file_len - offset;
+    reply[0] = 'm';
+    if (chunk <= length)
+      reply[0] = 'l';
+    else
+      chunk = length;
+
+    memcpy(&reply[1], top->exec_file.c_str() + offset, chunk);
+    return this->send(socket_client, reply, chunk + 1);
+  }
   else if (strncmp ("qTStatus", data, strlen ("qTStatus")) == 0)
   {
     // not supported, send empty packet
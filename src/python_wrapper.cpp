@@ -240,9 +240,9 @@ extern "C" void bridge_init(const char *config_string, int verbose)
 }
 
 
-extern "C" void *gdb_server_open(void *cable, int socket_port)
+extern "C" void *gdb_server_open(void *cable, int socket_port, const char *exec_file)
 {
-  return (void *)new Gdb_server(new Log(), (Cable *)cable, system_config, socket_port);
+  return (void *)new Gdb_server(new Log(), (Cable *)cable, system_config, socket_port, exec_file);
 }
 
 extern "C" void gdb_server_close(void *arg, int kill)